@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+from config import RECORD, CSV_HEADER, ROW_FMT
+
+# main.py が出力したバイナリログ (.bin) を CSV に変換する
+# 使い方: python bin2csv.py results/sensor_log_XXXX.bin [出力先.csv]
+def convert(bin_file, csv_file):
+    data = Path(bin_file).read_bytes()
+    usable = len(data) - len(data) % RECORD.size
+    if usable != len(data):
+        print(f"末尾の不完全なレコード {len(data) - usable} byte を無視します")
+
+    with open(csv_file, "w", newline="") as f:
+        f.write(CSV_HEADER)
+        f.writelines(ROW_FMT % row for row in RECORD.iter_unpack(data[:usable]))
+    return usable // RECORD.size
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("使い方: python bin2csv.py <入力.bin> [出力.csv]")
+        sys.exit(1)
+
+    bin_file = Path(sys.argv[1])
+    csv_file = Path(sys.argv[2]) if len(sys.argv) == 3 else bin_file.with_suffix(".csv")
+    rows = convert(bin_file, csv_file)
+    print(f"{rows} 行を書き出しました（ファイル: {csv_file}）")
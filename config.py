@@ -0,0 +1,30 @@
+import struct
+
+# 実行時間
+RUN_TIME = 10         # sec
+FLUSH_INTERVAL = 0.5  # sec
+
+# I2C定義
+SDA_PIN = 2
+SCL_PIN = 3
+I2C_BUS_ID = 1
+BME280_I2C_ADDR = 0x76
+BNO055_I2C_ADDR = 0x28
+
+# GPIOピン定義
+LED_PIN = 6
+PWM_PIN = 18  # サンプリングクロック（この端子の立ち上がりで読み取る）
+
+# ログのレコード形式（main.py と bin2csv.py で共有）
+# tick, timestamp_ns, 気圧/温度/加速度/角速度/オイラー角 の11列（リトルエンディアン, 60byte）
+RECORD = struct.Struct("<qq11f")
+
+# CSV書式
+CSV_HEADER = ",".join([
+    "tick", "timestamp_ns",
+    "pressure_hPa", "temp_C",
+    "accel_x", "accel_y", "accel_z",
+    "gyro_x", "gyro_y", "gyro_z",
+    "euler_x", "euler_y", "euler_z"
+]) + "\n"
+ROW_FMT = "%d,%d," + ",".join(["%.4f"] * 11) + "\n"
@@ -0,0 +1,61 @@
+import ctypes
+import os
+
+# linux/i2c-dev.h, linux/i2c.h
+I2C_RDWR = 0x0707
+I2C_M_RD = 0x0001
+
+
+class _I2CMsg(ctypes.Structure):
+    _fields_ = [
+        ("addr", ctypes.c_uint16),
+        ("flags", ctypes.c_uint16),
+        ("len", ctypes.c_uint16),
+        ("buf", ctypes.POINTER(ctypes.c_uint8)),
+    ]
+
+
+class _I2CRdwrIoctlData(ctypes.Structure):
+    _fields_ = [
+        ("msgs", ctypes.POINTER(_I2CMsg)),
+        ("nmsgs", ctypes.c_uint32),
+    ]
+
+
+# ctypes.CDLL 経由の呼び出しは実行中 GIL を解放する
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.ioctl.argtypes = [ctypes.c_int, ctypes.c_ulong, ctypes.c_void_p]
+_libc.ioctl.restype = ctypes.c_int
+
+
+class I2CBus:
+    def __init__(self, bus_id):
+        self.fd = os.open(f"/dev/i2c-{bus_id}", os.O_RDWR)
+
+    def burst_reader(self, addr, reg, n):
+        return BurstRead(self.fd, addr, reg, n)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class BurstRead:
+    # start, addr+W, reg, restart, addr+R, n byte 読み出し, stop を1回の ioctl で行う
+    # メッセージとバッファは事前に確保し，呼び出し毎の確保をなくす
+    def __init__(self, fd, addr, reg, n):
+        self.fd = fd
+        self.reg = (ctypes.c_uint8 * 1)(reg)
+        self.buf = (ctypes.c_uint8 * n)()
+        self.msgs = (_I2CMsg * 2)(
+            _I2CMsg(addr, 0, 1, self.reg),
+            _I2CMsg(addr, I2C_M_RD, n, self.buf),
+        )
+        self.data = _I2CRdwrIoctlData(self.msgs, 2)
+        self.data_ref = ctypes.byref(self.data)
+
+    # 読み出し結果は self.buf に入る（次の read で上書きされる）
+    def read(self):
+        if _libc.ioctl(self.fd, I2C_RDWR, self.data_ref) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return self.buf
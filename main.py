@@ -1,157 +1,255 @@
 import pigpio
 import time
 import board
-import csv
+import asyncio
 import threading
-import collections
 import os
+import math
+import struct
 from datetime import datetime, timedelta
-from adafruit_bme280 import basic as adafruit_bme280  # noqa: E402
+from adafruit_bme280 import advanced as adafruit_bme280  # noqa: E402
+import adafruit_bno055  # noqa: E402
 from adafruit_bno055 import BNO055_I2C  # noqa: E402
 from pathlib import Path
+from fast_i2c import I2CBus
+from config import (
+    RUN_TIME, FLUSH_INTERVAL,
+    I2C_BUS_ID, BME280_I2C_ADDR, BNO055_I2C_ADDR,
+    LED_PIN, PWM_PIN,
+    RECORD,
+)
 
-# 実行時間
-RUN_TIME = 10         # sec
-FLUSH_INTERVAL = 0.5  # sec
+# リングバッファ（2のべき乗）
+RING_SIZE = 4096
+RING_MASK = RING_SIZE - 1
 
-# I2C定義
-SDA_PIN = 2
-SCL_PIN = 3
-I2C_BUS_ID = 1
-BME280_I2C_ADDR = 0x76
-BNO055_I2C_ADDR = 0x28
+# BME280 レジスタ
+BME280_REG_CONFIG = 0xF5  # t_sb[7:5] filter[4:2]
+BME280_REG_DATA = 0xF7    # press_msb 〜 hum_lsb (8byte)
+BME280_STANDBY = adafruit_bme280.STANDBY_TC_20
+BME280_STANDBY_MS = 20
 
-# GPIOピン定義
-LED_PIN = 6
-PWM_PIN = 18
-INTRPT_PIN = 17
+# BNO055 レジスタ
+BNO055_REG_DATA = 0x08  # ACC(0x08) MAG(0x0E) GYR(0x14) EUL(0x1A) 〜0x1F (24byte)
+BNO055_ACCEL_SCALE = 1 / 100                 # m/s^2
+BNO055_GYRO_SCALE = 0.001090830782496456     # rad/s (adafruit_bno055 と同じ単位)
+BNO055_EULER_SCALE = 1 / 16                  # 度
+
+# デバイスツリーから I2C バスのクロック周波数 [Hz] を取得する
+def read_i2c_clock(bus_id):
+    path = Path(f"/sys/class/i2c-adapter/i2c-{bus_id}/of_node/clock-frequency")
+    try:
+        return int.from_bytes(path.read_bytes()[:4], "big")
+    except OSError:
+        return None
+
+class BurstBME280(adafruit_bme280.Adafruit_BME280_I2C):
+    # 初期化・キャリブレーション読み出しは adafruit_bme280 に任せ，
+    # 計測値の読み出しだけ /dev/i2c を直接叩く（GILを解放する）
+    def __init__(self, i2c, bus, address=BME280_I2C_ADDR):
+        super().__init__(i2c, address=address)
+        # ドライバの初期化後はスリープモードのままで，0xF7 を直接読むと FORCE 計測も
+        # 起きないため，ノーマルモードで連続計測させる（オーバーサンプリングはドライバ既定値）
+        # standby_period の setter はノーマルモード中だと一旦スリープにしてから config を
+        # 書くため t_sb が 0 になる．スリープ中に config を直接書いてからノーマルモードにする
+        self._t_standby = BME280_STANDBY
+        self._write_register_byte(BME280_REG_CONFIG, self._t_standby << 5 | self._iir_filter << 2)
+        self.mode = adafruit_bme280.MODE_NORMAL
+        self._burst = bus.burst_reader(address, BME280_REG_DATA, 8)
+
+    # ノーマルモードの出力レート [Hz] = 1 / (計測時間(最大) + スタンバイ)
+    # 既定のオーバーサンプリング（温度×1, 気圧×16, 湿度×1）では 43.8ms + 20ms → 約15.7Hz
+    @property
+    def output_rate(self):
+        return 1000 / (self.measurement_time_max + BME280_STANDBY_MS)
+
+    # 気圧・温度・湿度を 0xF7 から 8byte 一括で読み出す（1回のI2Cトランザクション）
+    def read_all(self):
+        buf = self._burst.read()
+        adc_p = (buf[0] << 12) | (buf[1] << 4) | (buf[2] >> 4)
+        adc_t = (buf[3] << 12) | (buf[4] << 4) | (buf[5] >> 4)
+        adc_h = (buf[6] << 8) | buf[7]
+
+        # 気圧・湿度の補正には t_fine が必要なので温度を先に計算する
+        temperature = self._compensate_temperature(adc_t)
+        pressure = self._compensate_pressure(adc_p)
+        humidity = self._compensate_humidity(adc_h)
+        return pressure, temperature, humidity
+
+    # 以下の補正式は adafruit_bme280 (データシート 8.1節) と同じ
+    def _compensate_temperature(self, adc_t):
+        t1, t2, t3 = self._temp_calib
+        var1 = (adc_t / 16384.0 - t1 / 1024.0) * t2
+        var2 = (adc_t / 131072.0 - t1 / 8192.0) ** 2 * t3
+        self._t_fine = int(var1 + var2)
+        return self._t_fine / 5120.0
+
+    def _compensate_pressure(self, adc_p):
+        p1, p2, p3, p4, p5, p6, p7, p8, p9 = self._pressure_calib
+        var1 = float(self._t_fine) / 2.0 - 64000.0
+        var2 = var1 * var1 * p6 / 32768.0
+        var2 = var2 + var1 * p5 * 2.0
+        var2 = var2 / 4.0 + p4 * 65536.0
+        var3 = p3 * var1 * var1 / 524288.0
+        var1 = (var3 + p2 * var1) / 524288.0
+        var1 = (1.0 + var1 / 32768.0) * p1
+        if not var1:
+            raise ArithmeticError("キャリブレーション値が不正です")
+        pressure = 1048576.0 - adc_p
+        pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+        var1 = p9 * pressure * pressure / 2147483648.0
+        var2 = pressure * p8 / 32768.0
+        pressure = pressure + (var1 + var2 + p7) / 16.0
+        return pressure / 100  # hPa
+
+    def _compensate_humidity(self, adc_h):
+        h1, h2, h3, h4, h5, h6 = self._humidity_calib
+        var1 = float(self._t_fine) - 76800.0
+        var2 = h4 * 64.0 + (h5 / 16384.0) * var1
+        var3 = adc_h - var2
+        var4 = h2 / 65536.0
+        var5 = 1.0 + (h3 / 67108864.0) * var1
+        var6 = 1.0 + (h6 / 67108864.0) * var1 * var5
+        var6 = var3 * var4 * (var5 * var6)
+        humidity = var6 * (1.0 - h1 * var6 / 524288.0)
+        return min(max(humidity, 0.0), 100.0)
+
+class BurstBNO055(BNO055_I2C):
+    # ACC(3h) MAG(6byte 読み飛ばし) GYR(3h) EUL(3h)
+    MOTION = struct.Struct("<3h6x3h3h")
+
+    def __init__(self, i2c, bus, address=BNO055_I2C_ADDR):
+        super().__init__(i2c, address=address)
+        # 地磁気を使わない IMUPLUS（加速度+ジャイロのみ融合）で動かす
+        # オイラー角の heading は起動時の向き基準の相対値になる
+        self.mode = adafruit_bno055.IMUPLUS_MODE
+        self._burst = bus.burst_reader(address, BNO055_REG_DATA, self.MOTION.size)
+
+    # 加速度・角速度・オイラー角を 0x08 から 24byte 一括で読み出す
+    def read_motion_burst(self):
+        buf = self._burst.read()
+        ax, ay, az, gx, gy, gz, eh, er, ep = self.MOTION.unpack_from(buf)
+        return (
+            ax * BNO055_ACCEL_SCALE, ay * BNO055_ACCEL_SCALE, az * BNO055_ACCEL_SCALE,
+            gx * BNO055_GYRO_SCALE, gy * BNO055_GYRO_SCALE, gz * BNO055_GYRO_SCALE,
+            eh * BNO055_EULER_SCALE, er * BNO055_EULER_SCALE, ep * BNO055_EULER_SCALE,
+        )
 
 class SensorReader:
-    def __init__(self, pi, freq=100, output_file="sensor_log.csv", flush_interval=1.0):
+    def __init__(self, pi, freq=100, output_file="sensor_log.bin", flush_interval=1.0):
         self.pi = pi
         self.freq = freq
         self.tick = 0
+        self.running = False
+        # read_sensors 実行中は保持し，stop() はこれを取ってから書き出し・クローズする
+        self.sample_lock = threading.Lock()
         self.output_file = output_file
         self.flush_interval = flush_interval
 
-        self.buffer = collections.deque()
-        self.lock = threading.Lock()
+        # 割込み側が head，書き出し側が tail だけを進める（SPSCなのでロック不要）
+        # 固定長レコード（config.RECORD）を並べたバイト列として保持し，そのまま書き出す
+        self.buffer = bytearray(RING_SIZE * RECORD.size)
+        self.view = memoryview(self.buffer)
+        self.head = 0
+        self.tail = 0
 
         # I2C初期化
         i2c = board.I2C()
-        self.bme280 = adafruit_bme280.Adafruit_BME280_I2C(i2c, address=BME280_I2C_ADDR)
-        self.bno055 = BNO055_I2C(i2c, address=BNO055_I2C_ADDR)
-
-        # 最新センサデータ（スレッド間共有）
-        self.latest = {
-            "pressure": None,
-            "temperature": None,
-            "accel": (None, None, None),
-            "gyro": (None, None, None),
-            "euler": (None, None, None)
-        }
-
-        self.data_lock = threading.Lock()
-
-        # センサ読み取りスレッド起動
-        self.bme_thread = threading.Thread(target=self.read_bme280_loop)
-        self.bno_thread = threading.Thread(target=self.read_bno055_loop)
-        
-        # LED点灯スレッド
-        self.led_thread = threading.Thread(target=self.flush_led)
+        self.bus = I2CBus(I2C_BUS_ID)
+        self.bme280 = BurstBME280(i2c, self.bus, address=BME280_I2C_ADDR)
+        self.bno055 = BurstBNO055(i2c, self.bus, address=BNO055_I2C_ADDR)
+
+        # BME280 は出力レートより速く読んでも同じ値なので，何サンプルに1回読むかを決める
+        self.bme280_divider = math.ceil(freq / self.bme280.output_rate)
+        self.bme280_countdown = 0
+
+        # 直近のセンサ値（読み取り失敗時はこれを記録する）
+        self.env = (float("nan"),) * 2
+        self.motion = (float("nan"),) * 9
 
         # GPIO設定とPWM開始
+        # pigpio はモードに関係なく端子レベルを監視できるので，
+        # ハードウェアPWM端子の立ち上がりをそのまま割込みに使う（ループバック配線不要）
         self.output_pin = PWM_PIN
-        self.input_pin = INTRPT_PIN
+        self.input_pin = PWM_PIN
         self.pi.set_mode(self.output_pin, pigpio.OUTPUT)
-        self.pi.set_mode(self.input_pin, pigpio.INPUT)
 
         # 割込み登録
+        # pigpio のコールバックは1本の通知スレッドから直接呼ばれる．
+        # wait_for_edge() は呼び出し毎にコールバックを登録し 50ms 周期で
+        # 待つ実装のため，100Hz では立ち上がりを取りこぼすので使わない
         self.cb = self.pi.callback(self.input_pin, pigpio.RISING_EDGE, self.read_sensors)
 
-        # 書き出しスレッド
-        self.writer_thread = threading.Thread(target=self.flush_to_csv_loop)
-
-        # ヘッダ書き込み
-        with open(self.output_file, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "tick", "timestamp",
-                "pressure_hPa", "temp_C",
-                "accel_x", "accel_y", "accel_z",
-                "gyro_x", "gyro_y", "gyro_z",
-                "euler_x", "euler_y", "euler_z"
-            ])
-
-    def read_bme280_loop(self):
-        while self.running:
+        # 出力ファイルは開いたままにし，ファイルオブジェクトを通さず fd に直接書く
+        self.raw_fd = os.open(
+            self.output_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644
+        )
+
+    # 割込みごとに両センサをバースト読み出しする（1サンプル1回）
+    # BNO055 にはデータレディ割込みが無いため，トリガはPWMの立ち上がりを使う
+    def read_sensors(self, gpio, level, tick):
+        with self.sample_lock:
+            if not self.running:
+                return
+            timestamp = time.monotonic_ns()
+            # BME280 は bme280_divider サンプルに1回だけ読む
+            self.bme280_countdown -= 1
+            if self.bme280_countdown <= 0:
+                self.bme280_countdown = self.bme280_divider
+                try:
+                    pressure, temperature, _ = self.bme280.read_all()
+                    self.env = (pressure, temperature)
+                except Exception as e:
+                    print(f"[BME280] 読み取りエラー: {e}")
             try:
-                pressure = self.bme280.pressure
-                temperature = self.bme280.temperature
-                with self.data_lock:
-                    self.latest["pressure"] = pressure
-                    self.latest["temperature"] = temperature
+                self.motion = self.bno055.read_motion_burst()
             except Exception as e:
-                print(f"[BME280] 読み取りエラー: {e}")
-            time.sleep(0.005) # ポーリング処理 200Hz
-
+                print(f"[BNO055] 読み取りエラー: {e}")
 
-    def read_bno055_loop(self):
-        while self.running:
             try:
-                accel = self.bno055.acceleration or (None, None, None)
-                gyro = self.bno055.gyro or (None, None, None)
-                euler = self.bno055.euler or (None, None, None)
-                with self.data_lock:
-                    self.latest["accel"] = accel
-                    self.latest["gyro"] = gyro
-                    self.latest["euler"] = euler
+                offset = (self.head & RING_MASK) * RECORD.size
+                RECORD.pack_into(self.buffer, offset, self.tick, timestamp, *self.env, *self.motion)
+                self.head += 1
+
+                self.tick += 1
             except Exception as e:
-                print(f"[BNO055] 読み取りエラー: {e}")
-            time.sleep(0.005) # ポーリング処理 200Hz
+                print(f"[{self.tick}] 読み取りエラー: {e}")
 
-    def read_sensors(self, gpio, level, tick):
-        timestamp = time.time()
-        try:
-            with self.data_lock:
-                pressure = self.latest["pressure"]
-                temperature = self.latest["temperature"]
-                accel = self.latest["accel"]
-                gyro = self.latest["gyro"]
-                euler = self.latest["euler"]
-
-            row = [
-                self.tick, timestamp,
-                pressure, temperature,
-                *(accel or (None, None, None)),
-                *(gyro or (None, None, None)),
-                *(euler or (None, None, None))
-            ]
-
-            with self.lock:
-                self.buffer.append(row)
-
-            self.tick += 1
-        except Exception as e:
-            print(f"[{self.tick}] 読み取りエラー: {e}")
-
-    def flush_to_csv_loop(self):
+    # 書き出し・LED点灯は割込み以外の処理なので，専用スレッドではなく
+    # メインスレッドの asyncio タスクとして動かす（残りは stop() で書き出す）
+    async def flush_loop(self):
         while self.running:
-            # フラッシュ間隔を待機
-            time.sleep(self.flush_interval)
-            with self.lock:
-                rows = list(self.buffer)
-                self.buffer.clear()
-            if rows:
-                with open(self.output_file, "a", newline="") as f:
-                    writer = csv.writer(f)
-                    writer.writerows(rows)
-
-    def flush_led(self):
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        head = self.head
+        if head == self.tail:
+            return
+        if head - self.tail > RING_SIZE:
+            print(f"[リングバッファ] {head - self.tail - RING_SIZE} 行を取りこぼしました")
+            self.tail = head - RING_SIZE
+
+        # 折り返しがある場合は2回に分けて書き出す（数値→文字列の変換は bin2csv.py で行う）
+        start = (self.tail & RING_MASK) * RECORD.size
+        end = (head & RING_MASK) * RECORD.size
+        if start < end:
+            self.write_all(self.view[start:end])
+        else:
+            self.write_all(self.view[start:])
+            self.write_all(self.view[:end])
+        self.tail = head
+
+    def write_all(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.raw_fd, view):]
+
+    async def flush_led(self):
         cur_led_state = False
         while self.running:
             # フラッシュ間隔を待機
-            time.sleep(self.flush_interval / 2)
+            await asyncio.sleep(self.flush_interval / 2)
 
             # LEDの状態をトグル
             if cur_led_state:
@@ -163,19 +261,30 @@ class SensorReader:
     def start(self):
         self.running = True
         self.pi.hardware_PWM(self.output_pin, self.freq, 500000)
-        self.writer_thread.start()
-        self.bme_thread.start()
-        self.bno_thread.start()
-        self.led_thread.start()
+
+    # 書き出し・LEDタスクを動かしながら run_time 秒待つ
+    async def run(self, run_time):
+        tasks = [
+            asyncio.create_task(self.flush_loop()),
+            asyncio.create_task(self.flush_led()),
+        ]
+        try:
+            await asyncio.sleep(run_time)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     def stop(self):
-        self.running = False
+        # 割込みを止め，実行中の read_sensors が終わるのを待ってから
+        # リングに残った行を書き出し，ファイルとI2Cバスを閉じる
         self.cb.cancel()
         self.pi.hardware_PWM(self.output_pin, 0, 0)
-        self.writer_thread.join()
-        self.bme_thread.join()
-        self.bno_thread.join()
-        self.led_thread.join()
+        with self.sample_lock:
+            self.running = False
+        self.flush()
+        os.close(self.raw_fd)
+        self.bus.close()
 
 if __name__ == "__main__":
     pi = pigpio.pi()
@@ -183,12 +292,16 @@ if __name__ == "__main__":
         print("pigpiod が起動していません")
         exit()
 
+    # バス速度の確認（400kHz になっていない場合は README を参照）
+    i2c_clock = read_i2c_clock(I2C_BUS_ID)
+    print(f"I2Cバス速度: {i2c_clock if i2c_clock else '不明'} Hz")
+
     # 現在時刻を使ってファイル名を生成
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
     base_dir = Path(os.getcwd())
     output_file = base_dir / 'results'
     output_file.mkdir(parents=True, exist_ok=True)
-    output_file = output_file / f"sensor_log_{timestamp}.csv"
+    output_file = output_file / f"sensor_log_{timestamp}.bin"
 
     reader = SensorReader(pi, freq=100, output_file=output_file, flush_interval=FLUSH_INTERVAL)
     pi.set_mode(LED_PIN, pigpio.OUTPUT)
@@ -196,7 +309,7 @@ if __name__ == "__main__":
         # LED点灯
         reader.start()
         print(f"記録を開始しました（ファイル: {output_file}）")
-        time.sleep(RUN_TIME)
+        asyncio.run(reader.run(RUN_TIME))
     except KeyboardInterrupt:
         print("終了処理中...")
     finally: